@@ -1,91 +1,267 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os
+import plotly.io as pio
+import numpy as np
+
+from convert_data import UNIFIED_PARQUET, convert_unified_trade, ensure_parquet
 
 st.set_page_config(layout="wide")
 
 st.title("Turkey–Poland Trade Explorer (2013–2024)")
 
 
-@st.cache_data(ttl=3600)
+DESC_MAP = {
+    "HS6": ["HS6", "HS_Description"],
+    "HS4": ["HS4", "HS4Desc"],
+    "HS2": ["HS2", "HS2Desc"]
+}
+
+
+# cache_resource hands every session the same objects without a copy; treat them as read-only
+@st.cache_resource(ttl=3600)
 def load_data():
-    base = os.path.dirname(__file__)
-    path = os.path.join(base, "data", "Unified_Trade_CLEAN_rebuilt.xlsx")
+    # converted from Unified_Trade_CLEAN_rebuilt.xlsx by convert_data.py
+    df = pd.read_parquet(
+        ensure_parquet(UNIFIED_PARQUET, convert_unified_trade),
+        engine="pyarrow",
+        columns=[
+            "Year", "Direction",
+            "HS6", "HS4", "HS2",
+            "HS_Description", "HS4Desc", "HS2Desc",
+            "Final_FOB_Value"
+        ]
+    )
 
-    df = pd.read_excel(path, engine="openpyxl")
+    # low-cardinality keys: filters and groupbys work on integer codes
+    for col in ["Direction", "HS2", "HS4", "HS6"]:
+        df[col] = df[col].astype("category")
 
-    # --- normalize column names ---
-    df.columns = df.columns.str.strip()
+    # narrow numeric types halve the bytes every groupby-sum has to move
+    df["Year"] = df["Year"].astype("int16")
+    df["Final_FOB_Value"] = df["Final_FOB_Value"].astype("float32")
 
-    # map possible variants to standard names
-    rename_map = {
-    "HS4 Desc": "HS4Desc",
-    "HS4 description": "HS4Desc",
-    "HS4Description": "HS4Desc",
-    "HS4_desc": "HS4Desc",
+    # ---- pre-aggregated values per (Direction, code, Year) for each HS level ----
+    # one scan of the full frame at HS6 grain; HS4/HS2 roll up from that small result
+    by_hs6 = df.groupby(
+        ["Direction", "HS2", "HS4", "HS6", "Year"], observed=True
+    )["Final_FOB_Value"].sum()
 
-    "HS2 Desc": "HS2Desc",
-    "HS2 description": "HS2Desc",
-    "HS2Description": "HS2Desc",
-    "HS2_desc": "HS2Desc",
+    agg_by = {
+        lvl: by_hs6.groupby(level=["Direction", lvl, "Year"], observed=True).sum()
+        for lvl in ["HS2", "HS4", "HS6"]
     }
 
-    df = df.rename(columns=rename_map)
-    for col in ["HS_Description", "HS4Desc", "HS2Desc"]:
-        if col in df.columns:
-            df[col] = df[col].astype(str).fillna("Unknown").str.strip()
+    # ---- first description per code for each HS level ----
+    desc_maps = {
+        lvl: df.drop_duplicates(lvl).set_index(lvl)[desc_col]
+        for lvl, desc_col in DESC_MAP.values()
+    }
 
-    df["HS6"] = df["HS6"].astype(str).str.zfill(6)
-    df["HS4"] = df["HS4"].astype(str).str.zfill(4)
-    df["HS2"] = df["HS2"].astype(str).str.zfill(2)
-    return df
+    # ---- every (Direction, code, description) pair, in workbook order, for the search box ----
+    option_pairs = {
+        lvl: df[["Direction", lvl, desc_col]].drop_duplicates()
+        for lvl, desc_col in DESC_MAP.values()
+    }
 
-DESC_MAP = {
-    "HS6": ["HS6", "HS_Description"],
-    "HS4": ["HS4", "HS4Desc"],
-    "HS2": ["HS2", "HS2Desc"]
-}
+    # the row-level frame is not used past this point; keep only the small results in the cache
+    return agg_by, desc_maps, option_pairs
 
-def project_series_cagr(df_series):
-    df_series = df_series.sort_values("Year")
 
-    recent = df_series[df_series["Year"] >= 2020]
+def cagr_project(years, values):
+    # plain ndarray kernel: year-sorted (years, values) -> projected (years, values) or None
+    recent = years >= 2020
 
-    if len(recent) < 2:
+    if recent.sum() < 2:
         return None
 
-    start = recent.iloc[0]["Final_FOB_Value"]
-    end = recent.iloc[-1]["Final_FOB_Value"]
+    start, end = values[recent][[0, -1]]
 
     if start <= 0:
         return None
 
-    years = recent.iloc[-1]["Year"] - recent.iloc[0]["Year"]
+    span = years[recent][-1] - years[recent][0]
 
-    if years == 0:
+    if span == 0:
         return None
 
-    cagr = (end / start) ** (1 / years) - 1
+    cagr = (end / start) ** (1 / span) - 1
 
     cagr = max(min(cagr, 0.35), -0.35)
 
-    projections = []
+    # compound from the last observed year up to 2030 in one step
+    last_year = int(years[-1])
+    steps = np.arange(1, 2031 - last_year)
+    projected = np.clip(values[-1] * np.power(1 + cagr, steps), 0, None)
+
+    return last_year + steps, projected
+
+
+def project_series_cagr(df_series):
+    result = cagr_project(
+        df_series["Year"].to_numpy(),
+        df_series["Final_FOB_Value"].to_numpy()
+    )
+
+    if result is None:
+        return None
+
+    years, projected = result
+
+    return pd.DataFrame({
+        "Year": years,
+        "Final_FOB_Value": projected
+    })
+
+
+all_years = list(range(2013, 2025))
+proj_years = list(range(2025, 2031))
+
+
+# ---- Cached views derived from load_data() ----
+@st.cache_data(ttl=3600)
+def get_options(direction_key, level):
+    _, _, option_pairs = load_data()
+    code_col, desc_col = DESC_MAP[level]
+
+    # pairs the direction actually has: a code listed once per wording of its description
+    pairs = option_pairs[level]
+    rows = pairs[pairs["Direction"] == direction_key]
+
+    # (code, description) tuples: the selectbox keeps a choice by value, not by list position
+    options = list(zip(rows[code_col].astype(str), rows[desc_col]))
+
+    # first wording of each code in this direction, for the description lines
+    first = rows.drop_duplicates(code_col)
+    first_desc = dict(zip(first[code_col].astype(str), first[desc_col]))
+
+    return options, first_desc
+
+
+@st.cache_data(ttl=3600)
+def get_top10(direction_key, level, latest_year):
+    agg_by, _, _ = load_data()
+
+    top10 = (
+        agg_by[level].loc[direction_key]
+        .xs(latest_year, level="Year")
+        .nlargest(10)
+        .reset_index()
+    )
+
+    top10[level] = top10[level].astype(str)   # 👈 force text
+    return top10
 
-    last_value = df_series.iloc[-1]["Final_FOB_Value"]
-    last_year = int(df_series.iloc[-1]["Year"])
 
-    for y in range(last_year + 1, 2031):
-        last_value = last_value * (1 + cagr)
-        projections.append({
-            "Year": y,
-            "Final_FOB_Value": max(last_value, 0)
-        })
+@st.cache_data(ttl=3600)
+def get_years(direction_key, level, code=None):
+    agg_by, _, _ = load_data()
 
-    return pd.DataFrame(projections)
+    totals = agg_by[level].loc[direction_key]
+    if code is not None:
+        totals = totals.loc[[code]]
 
+    # sorted years with data for the filter state; empty if none
+    return sorted(totals.index.get_level_values("Year").unique())
 
-df = load_data()
+
+@st.cache_data(ttl=3600)
+def get_pie_data(direction_key, level, pie_year):
+    agg_by, _, _ = load_data()
+
+    pie_data = agg_by[level].loc[direction_key].xs(pie_year, level="Year").reset_index()
+    total = pie_data["Final_FOB_Value"].astype("float64").sum()
+    pie_data["Share_%"] = (pie_data["Final_FOB_Value"] / total) * 100
+    return pie_data
+
+
+@st.cache_data(ttl=3600)
+def get_chart_data(direction_key, level, codes, show_projection):
+    agg_by, _, _ = load_data()
+    series = agg_by[level].loc[direction_key].loc[list(codes)]
+
+    if series.empty:
+        return None, []
+
+    # HISTORICAL PART – only up to 2024, missing years filled with 0
+    hist = (
+        series.unstack(level, fill_value=0)
+        .reindex(all_years, fill_value=0)
+        .stack()
+        .rename("Final_FOB_Value")
+        .reset_index()
+        .assign(Segment="Historical")
+    )
+
+    segments = [hist]
+    sparse_codes = []   # codes with too few values to project
+
+    if show_projection:
+        grouped = series.reset_index()
+        by_code = grouped.groupby(level, observed=True, sort=False)
+
+        positive = (grouped["Final_FOB_Value"] > 0).groupby(grouped[level], observed=True, sort=False).sum()
+        sparse_codes = list(positive.index[positive < 2])
+
+        projections = {c: project_series_cagr(subset) for c, subset in by_code}
+        projections = {c: p for c, p in projections.items() if p is not None and not p.empty}
+
+        if projections:
+            # each projected line starts at the code's last observed value
+            last_hist = by_code.tail(1)
+            last_hist = last_hist[last_hist[level].isin(list(projections))]
+
+            proj = pd.concat(projections, names=[level]).reset_index(level)
+
+            segments.append(
+                pd.concat([last_hist, proj], ignore_index=True)
+                .assign(Segment="Projection")
+            )
+
+    chart_data = pd.concat(segments, ignore_index=True)
+    chart_data[level] = chart_data[level].astype(str)
+    return chart_data, sparse_codes
+
+
+@st.cache_data(ttl=3600)
+def make_timeseries_fig(direction_key, level, codes, show_projection, title_text):
+    chart_data, _ = get_chart_data(direction_key, level, codes, show_projection)
+
+    fig = px.line(
+        chart_data,
+        x="Year",
+        y="Final_FOB_Value",
+        color=level,
+        line_dash="Segment",
+        labels={"Final_FOB_Value": "Trade Value (USD)"},
+        render_mode="webgl"   # Scattergl traces instead of SVG paths
+    )
+
+    fig.update_layout(
+        title=dict(
+            text=title_text,
+            x=0.5,
+            xanchor="center",
+            font=dict(size=20)
+        ),
+        yaxis_title="Trade Value (USD)",
+        yaxis=dict(showgrid=True),
+        xaxis=dict(
+            showgrid=True,
+            tickmode="array",
+            tickvals=all_years + (proj_years if show_projection else []),
+            ticktext=[str(y) for y in (all_years + (proj_years if show_projection else []))]
+        ),
+        legend_title_text="",
+        # zoom/legend state survives reruns until the plotted selection changes
+        uirevision=f"{direction_key}|{level}|{','.join(codes)}"
+    )
+
+    # cache the serialized figure so reruns skip building it again
+    return fig.to_json()
+
+
+agg_by, desc_maps, _ = load_data()
 
 st.sidebar.header("Filters")
 
@@ -95,7 +271,6 @@ direction = st.sidebar.selectbox(
 )
 
 direction_key = direction.replace(" ", "_")
-data = df[df["Direction"] == direction_key]
 
 level = st.sidebar.selectbox(
     "Aggregation Level",
@@ -103,20 +278,18 @@ level = st.sidebar.selectbox(
 )
 show_projection = st.sidebar.checkbox("Show Trend Projections to 2030")
 
-code_col, desc_col = DESC_MAP[level]
-
-options = data[[code_col, desc_col]].drop_duplicates()
-options[desc_col] = options[desc_col].fillna("Unknown").astype(str)
-
-display = options[code_col].astype(str) + " – " + options[desc_col]
+options, first_desc = get_options(direction_key, level)
 
-
-selected = st.sidebar.selectbox(
+# None is Home; any other value is a (code, description) pair
+selected_option = st.sidebar.selectbox(
     "Search by Code or Description",
-    ["Home"] + list(display)
+    [None] + options,
+    format_func=lambda o: "Home" if o is None else f"{o[0]} – {o[1]}"
 )
 if st.sidebar.button("Reset to Home"):
-    selected = "Home"
+    selected_option = None
+
+selected = "Home" if selected_option is None else f"{selected_option[0]} – {selected_option[1]}"
 
 if selected == "Home":
     
@@ -128,30 +301,36 @@ if selected == "Home":
 
 # ---- Define code variable if something is selected ----
 if selected != "Home":
-    code = selected.split(" – ")[0]
-    data = data[data[level] == code]
+    code = selected_option[0]
+
+# ---- One export config shared by every chart on the page ----
+EXPORT_CONFIG = {
+    "displaylogo": False,
+    "modeBarButtonsToAdd": ["toImage"],
+    "toImageButtonOptions": {
+        "format": "svg",      # or "png"
+        "filename": "top10_trade" if selected == "Home" else f"{code}_{direction_key}_timeseries",
+        "height": 800,
+        "width": 1200,
+        "scale": 3
+    }
+}
+
+# ---- Years with trade data for the chosen direction (and code) ----
+years = get_years(direction_key, level, None if selected == "Home" else code)
 
 # ---- Safety check ----
-if data.empty:
+if not years:
     st.warning("No trade data available for the selected filters.")
     st.stop()
 
 # ---- Define latest_year BEFORE top-10 block ----
-latest_year = data["Year"].max()
+latest_year = years[-1]
 
 # ---- TOP 10 BLOCK ----
 if selected == "Home":
 
-    default = data[data["Year"] == latest_year]
-
-    top10 = (
-        default.groupby(level, as_index=False)["Final_FOB_Value"]
-        .sum()
-        .sort_values("Final_FOB_Value", ascending=False)
-        .head(10)
-    )
-
-    top10[level] = top10[level].astype(str)   # 👈 force text
+    top10 = get_top10(direction_key, level, latest_year)
 
     fig_default = px.bar(
         top10,
@@ -175,100 +354,38 @@ if selected == "Home":
     st.plotly_chart(
         fig_default,
         use_container_width=True,
-        config={
-            "displaylogo": False,
-            "modeBarButtonsToAdd": ["toImage"],
-            "toImageButtonOptions": {
-                "format": "svg",      # or "png"
-                "filename": "top10_trade" if selected == "Home" else f"{code}_{direction_key}_timeseries",
-                "height": 800,
-                "width": 1200,
-                "scale": 3
-        }
-    }
+        config=EXPORT_CONFIG,
+        key="top10_bar"
 )
 # ---- HS6 DESCRIPTIONS ----
 if selected == "Home":
 
     st.markdown("#### HS Code Descriptions")
 
-    desc_source = options
     codes = top10[level]
 
     for c in codes:
-        row = desc_source[desc_source[level] == c]
-        if not row.empty:
-            desc = row.iloc[0].iloc[1]
-        else:
-            desc = "Description not available"
+        desc = first_desc.get(c, "Description not available")
 
         st.markdown(f"**{c}** – {desc}")
 
 # ---- TIME SERIES GRAPH ----
 
-all_years = list(range(2013, 2025))
-proj_years = list(range(2025, 2031))
-
 if selected == "Home":
-    top_codes = list(top10[level])
-    data_for_chart = data[data[level].isin(top_codes)]
+    chart_codes = tuple(top10[level])
 else:
-    data_for_chart = data
-
-grouped = data_for_chart.groupby(["Year", level], as_index=False)["Final_FOB_Value"].sum()
-
-# Check if we have enough data at all
-
-complete = []
+    chart_codes = (code,)
 
-for c in grouped[level].unique():
-
-    subset = grouped[grouped[level] == c]
-
-    # Only warn about projections when they are requested
-    if show_projection and subset[subset["Final_FOB_Value"] > 0].shape[0] < 2:
-        st.info(f"Not enough data to create projections for code {c}. Showing historical data only.")
-
-    # HISTORICAL PART – only up to 2024
-    hist_full = pd.DataFrame({
-        "Year": all_years,
-        level: c
-    })
+chart_data, sparse_codes = get_chart_data(direction_key, level, chart_codes, show_projection)
 
-    hist = hist_full.merge(subset, on=["Year", level], how="left")
-    hist["Final_FOB_Value"] = hist["Final_FOB_Value"].fillna(0)
-    hist["Segment"] = "Historical"
+# Only warn about projections when they are requested
+for c in sparse_codes:
+    st.info(f"Not enough data to create projections for code {c}. Showing historical data only.")
 
-    if show_projection:
-        proj = project_series_cagr(subset)
-
-        if proj is not None and not proj.empty:
-
-            last_hist = subset.sort_values("Year").iloc[-1:]
-            last_hist = last_hist.copy()
-            last_hist["Segment"] = "Projection"
-
-            proj[level] = c
-            proj["Segment"] = "Projection"
-
-            merged_proj = pd.concat([last_hist, proj], ignore_index=True)
-
-            merged = pd.concat([hist, merged_proj], ignore_index=True)
-        else:
-            merged = hist
-    else:
-        merged = hist
-
-    complete.append(merged)
-
-
-if not complete:
+if chart_data is None:
     st.warning("Not enough data available to generate chart for this selection.")
     st.stop()
 
-chart_data = pd.concat(complete, ignore_index=True)
-chart_data = chart_data.sort_values("Year")
-
 if selected == "Home":
     title_text = f"Trade Value of Top 10 Best Performing {level} Categories Over Time"
 else:
@@ -279,47 +396,15 @@ else:
 
     title_text = f"Export of Good {code} {flow} Over Time"
     
-fig = px.line(
-    chart_data,
-    x="Year",
-    y="Final_FOB_Value",
-    color=level,
-    line_dash="Segment",
-    labels={"Final_FOB_Value": "Trade Value (USD)"}
-)
-
-fig.update_layout(
-    title=dict(
-        text=title_text,
-        x=0.5,
-        xanchor="center",
-        font=dict(size=20)
-    ),
-    yaxis_title="Trade Value (USD)",
-    yaxis=dict(showgrid=True),
-    xaxis=dict(
-        showgrid=True,
-        tickmode="array",
-        tickvals=all_years + (proj_years if show_projection else []),
-        ticktext=[str(y) for y in (all_years + (proj_years if show_projection else []))]
-    ),
-    legend_title_text=""
+fig = pio.from_json(
+    make_timeseries_fig(direction_key, level, chart_codes, show_projection, title_text)
 )
 
 st.plotly_chart(
         fig,
         use_container_width=True,
-        config={
-            "displaylogo": False,
-            "modeBarButtonsToAdd": ["toImage"],
-            "toImageButtonOptions": {
-                "format": "svg",      # or "png"
-                "filename": "top10_trade" if selected == "Home" else f"{code}_{direction_key}_timeseries",
-                "height": 800,
-                "width": 1200,
-                "scale": 3
-        }
-    }
+        config=EXPORT_CONFIG,
+        key="ts_main"
 )
 # ================= SHARE STRUCTURE =================
 if selected == "Home":
@@ -328,30 +413,21 @@ if selected == "Home":
 
     pie_year = st.selectbox(
         "Select year for structure",
-        sorted(data["Year"].unique()),
-        index=len(sorted(data["Year"].unique())) - 1
+        years,
+        index=len(years) - 1
     )
 
-    # ---- Aggregate for selected year ----
-    pie_data = (
-        data[data["Year"] == pie_year]
-        .groupby(level, as_index=False)["Final_FOB_Value"]
-        .sum()
-    )
+    # ---- Values and shares for selected year ----
+    pie_data = get_pie_data(direction_key, level, pie_year)
 
     if pie_data.empty:
         st.warning("No data available for this year.")
         st.stop()
 
-    # ---- Compute shares ----
-    total = pie_data["Final_FOB_Value"].sum()
-    pie_data["Share_%"] = (pie_data["Final_FOB_Value"] / total) * 100
-
     # ---- Text only for >=1% ----
-    pie_data["Display"] = pie_data.apply(
-        lambda r: f"{r[level]} ({r['Share_%']:.1f}%)" if r["Share_%"] >= 1 else "",
-        axis=1
-    )
+    share = pie_data["Share_%"].to_numpy()
+    labels = pie_data[level].astype(str) + " (" + np.char.mod("%.1f", share) + "%)"
+    pie_data["Display"] = np.where(share >= 1, labels, "")
 
     fig_pie = px.pie(
         pie_data,
@@ -378,41 +454,15 @@ if selected == "Home":
     st.plotly_chart(
         fig_pie,
         use_container_width=True,
-        config={
-            "displaylogo": False,
-            "modeBarButtonsToAdd": ["toImage"],
-            "toImageButtonOptions": {
-                "format": "svg",      # or "png"
-                "filename": "top10_trade" if selected == "Home" else f"{code}_{direction_key}_timeseries",
-                "height": 800,
-                "width": 1200,
-                "scale": 3
-            }
-        }
+        config=EXPORT_CONFIG,
+        key="share_pie"
     )
     # ---- Average share ----
     avg_share = pie_data.loc[pie_data["Final_FOB_Value"] > 0, "Share_%"].mean()
     st.markdown(f"**Average category share:** {avg_share:.2f}%")
 
-    # ---- Merge correct descriptions for chosen level ----
-    desc_cols = DESC_MAP[level]
-
-    if not all(c in df.columns for c in desc_cols):
-        st.error(f"Missing description columns for {level}: {desc_cols}")
-        st.stop()
-
-    desc_map = (
-        df[desc_cols]
-        .drop_duplicates()
-        .groupby(desc_cols[0])[desc_cols[1]]
-        .apply(lambda x: x.iloc[0])
-        .reset_index()
-    )
-
-    desc_map.columns = [level, "Description"]
-
-    # ---- attach descriptions ----
-    pie_table = pie_data.merge(desc_map, on=level, how="left")
+    # ---- attach descriptions for chosen level ----
+    pie_table = pie_data.join(desc_maps[level].rename("Description"), on=level)
 
     # make sure numeric column exists
     if "Share_%" not in pie_table.columns:
@@ -421,23 +471,16 @@ if selected == "Home":
 
     pie_table = pie_table[[level, "Description", "Share_%"]]
 
-    # ---- sort numerically first ----
-    pie_table_sorted = pie_table.sort_values("Share_%", ascending=False).copy()
+    # ---- sort numerically, tiny values at the bottom, in one pass ----
+    pie_table_sorted = (
+        pie_table.assign(_tiny=pie_table["Share_%"] < 0.01)
+        .sort_values(["_tiny", "Share_%"], ascending=[True, False], kind="mergesort")
+        .drop(columns="_tiny")
+    )
 
     # ---- format for display AFTER sorting ----
-    def format_share(x):
-        if x < 0.01:
-            return "<0.01"
-        else:
-            return f"{x:.2f}"
-
-    pie_table_sorted["Share_Display"] = pie_table_sorted["Share_%"].apply(format_share)
-
-    # ---- move tiny values to bottom ----
-    tiny = pie_table_sorted[pie_table_sorted["Share_%"] < 0.01]
-    normal = pie_table_sorted[pie_table_sorted["Share_%"] >= 0.01]
-
-    pie_table_sorted = pd.concat([normal, tiny], ignore_index=True)
+    share = pie_table_sorted["Share_%"].to_numpy()
+    pie_table_sorted["Share_Display"] = np.where(share < 0.01, "<0.01", np.char.mod("%.2f", share))
 
     # ---- final table for display ----
     pie_table_sorted = pie_table_sorted[[level, "Description", "Share_Display"]]
@@ -457,7 +500,7 @@ if selected == "Home":
 if selected != "Home":
     st.subheader("Selected Code Description")
 
-    desc = options[options[level] == code].iloc[0].iloc[1]
+    desc = first_desc[code]
 
     if desc == "Description not available":
         desc = "No official description available in dataset"
@@ -0,0 +1,108 @@
+import os
+
+import pandas as pd
+
+# One-off conversion of the Excel sources in data/ to Parquet.
+# Re-run after replacing a workbook:  python convert_data.py
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE, "data")
+
+UNIFIED_XLSX = os.path.join(DATA_DIR, "Unified_Trade_CLEAN_rebuilt.xlsx")
+UNIFIED_PARQUET = os.path.join(DATA_DIR, "Unified_Trade_CLEAN_rebuilt.parquet")
+
+EU_TRADE_XLSX = os.path.join(DATA_DIR, "EU-TR_trade.xlsx")
+EU_TRADE_PARQUET = os.path.join(DATA_DIR, "EU-TR_trade.parquet")
+
+MILITARY_XLSX = os.path.join(DATA_DIR, "EURMTR_Final.xlsx")
+MILITARY_PARQUET = os.path.join(DATA_DIR, "EURMTR_Final.parquet")
+
+# map possible variants to standard names
+RENAME_MAP = {
+    "HS4 Desc": "HS4Desc",
+    "HS4 description": "HS4Desc",
+    "HS4Description": "HS4Desc",
+    "HS4_desc": "HS4Desc",
+
+    "HS2 Desc": "HS2Desc",
+    "HS2 description": "HS2Desc",
+    "HS2Description": "HS2Desc",
+    "HS2_desc": "HS2Desc",
+}
+
+HS_WIDTHS = {"HS6": 6, "HS4": 4, "HS2": 2}
+
+
+def ensure_parquet(parquet_path, convert):
+    # git does not keep mtimes, so the committed Parquet files are trusted as-is;
+    # only a missing file is converted. Re-run this script after replacing a workbook.
+    if not os.path.exists(parquet_path):
+        convert()
+    return parquet_path
+
+
+def convert_unified_trade():
+    df = pd.read_excel(UNIFIED_XLSX, engine="calamine")
+
+    # --- normalize column names ---
+    df.columns = df.columns.str.strip()
+    df = df.rename(columns=RENAME_MAP)
+
+    # --- clean descriptions (some are stored as numbers in the workbook) ---
+    for col in ["HS_Description", "HS4Desc", "HS2Desc"]:
+        df[col] = df[col].fillna("Unknown").astype(str).str.strip()
+
+    # --- zero-padded HS codes, stored as Arrow strings ---
+    for col, width in HS_WIDTHS.items():
+        df[col] = df[col].astype(str).str.zfill(width).astype("string[pyarrow]")
+
+    df.to_parquet(UNIFIED_PARQUET, engine="pyarrow", index=False)
+    return df
+
+
+def convert_eu_trade():
+    df = pd.read_excel(
+        EU_TRADE_XLSX,
+        engine="calamine",
+        usecols=["refYear", "Importer", "Exporter", "primaryValue"]
+    )
+
+    df = df.rename(columns={
+        "refYear": "Year",
+        "primaryValue": "Value"
+    })
+
+    df["Year"] = df["Year"].astype(int)
+    df["Importer"] = df["Importer"].astype(str)
+    df["Exporter"] = df["Exporter"].astype(str)
+    df["Value"] = pd.to_numeric(df["Value"], errors="coerce").fillna(0)
+
+    df.to_parquet(EU_TRADE_PARQUET, engine="pyarrow", index=False)
+    return df
+
+
+def convert_military_trade():
+    df = pd.read_excel(
+        MILITARY_XLSX,
+        engine="calamine",
+        usecols=["refYear", "cmdCode", "Importer", "primaryValue"]
+    )
+
+    df["refYear"] = df["refYear"].astype(int)
+    df["cmdCode"] = df["cmdCode"].astype(str).str.strip()
+    df["Importer"] = df["Importer"].astype(str)
+    df["primaryValue"] = pd.to_numeric(df["primaryValue"], errors="coerce").fillna(0)
+
+    df.to_parquet(MILITARY_PARQUET, engine="pyarrow", index=False)
+    return df
+
+
+if __name__ == "__main__":
+    convert_unified_trade()
+    print(f"Wrote {UNIFIED_PARQUET}")
+
+    convert_eu_trade()
+    print(f"Wrote {EU_TRADE_PARQUET}")
+
+    convert_military_trade()
+    print(f"Wrote {MILITARY_PARQUET}")
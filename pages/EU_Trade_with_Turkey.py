@@ -1,9 +1,10 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os
 import numpy as np
 
+from convert_data import EU_TRADE_PARQUET, convert_eu_trade, ensure_parquet
+
 EXPORT_CONFIG = {
     "displaylogo": False,
     "modeBarButtonsToAdd": ["toImage"],
@@ -19,32 +20,108 @@ EXPORT_CONFIG = {
 st.set_page_config(layout="wide")
 st.title("Turkey ↔ EU Total Trade (2013–2024)")
 
+TURKEY_NAMES = ["türkiye", "turkey"]
+ALL_YEARS = list(range(2013, 2025))
+
+
+# match Turkey on the categories once, then select rows by category code
+def is_turkey(col):
+    tr_codes = np.flatnonzero(col.cat.categories.str.lower().isin(TURKEY_NAMES))
+    return col.cat.codes.isin(tr_codes)
+
+
 # ---------- LOAD ----------
-@st.cache_data
+# cache_resource hands every session the same frame without a copy; treat it as read-only
+@st.cache_resource
 def load_trade():
-    
-    base = os.path.dirname(__file__)
-    path = os.path.join(base, "..", "data", "EU-TR_trade.xlsx")
+    # converted from EU-TR_trade.xlsx by convert_data.py
+    df = pd.read_parquet(ensure_parquet(EU_TRADE_PARQUET, convert_eu_trade), engine="pyarrow")
 
-    df = pd.read_excel(path)
+    for col in ["Importer", "Exporter"]:
+        df[col] = df[col].astype("category")
 
-    df = df.rename(columns={
-        "refYear": "Year",
-        "Importer": "Importer",
-        "Exporter": "Exporter",
-        "primaryValue": "Value"
-    })
+    df["Year"] = df["Year"].astype("int16")
+    df["Value"] = df["Value"].astype("float32")
 
-    df["Year"] = df["Year"].astype(int)
-    df["Importer"] = df["Importer"].astype(str)
-    df["Exporter"] = df["Exporter"].astype(str)
-    df["Value"] = pd.to_numeric(df["Value"], errors="coerce").fillna(0)
+    # a row's Turkey side never changes: flag it once here
+    df["is_tr_importer"] = is_turkey(df["Importer"])
+    df["is_tr_exporter"] = is_turkey(df["Exporter"])
 
     return df
 
-df = load_trade()
-TURKEY_NAMES = ["türkiye", "turkey"]
-ALL_YEARS = list(range(2013, 2025))
+
+# ---------- CACHED VIEWS ----------
+@st.cache_data
+def get_countries():
+    df = load_trade()
+    return sorted(df.loc[~df["is_tr_importer"], "Importer"].unique())
+
+
+@st.cache_data
+def get_measure_data(metric):
+    df = load_trade()
+
+    is_tr_importer = df["is_tr_importer"].to_numpy()
+    is_tr_exporter = df["is_tr_exporter"].to_numpy()
+
+    # select only the columns the views use; no full-width row copies
+    if metric == "Exports to Turkey from EU":
+        data = (
+            df.loc[is_tr_importer & ~is_tr_exporter, ["Year", "Exporter", "Value"]]
+            .rename(columns={"Exporter": "Country"})
+        )
+
+    elif metric == "Exports to EU from Turkey":
+        data = (
+            df.loc[is_tr_exporter & ~is_tr_importer, ["Year", "Importer", "Value"]]
+            .rename(columns={"Importer": "Country"})
+        )
+
+    else:  # Total Trade Volume
+        # one side is Turkey; the partner is the exporter for flows into Turkey
+        mask = is_tr_importer ^ is_tr_exporter
+        country = np.where(
+            is_tr_importer,
+            df["Exporter"].to_numpy(),
+            df["Importer"].to_numpy()
+        )
+
+        data = (
+            df.loc[mask, ["Year", "Value"]]
+            .assign(Country=country[mask])
+            .groupby(["Year", "Country"], observed=True, as_index=False)["Value"]
+            .sum()
+        )
+
+    return data
+
+
+@st.cache_data
+def get_time_series(metric):
+    data = get_measure_data(metric)
+
+    return (
+        data.groupby(["Year", "Country"], observed=True, as_index=False)["Value"]
+        .sum()
+    )
+
+
+@st.cache_data
+def get_line_series(metric, top_n, pinned):
+    ts = get_time_series(metric)
+
+    # keep the top-N countries by total value (plus pinned ones); the rest become "Other"
+    totals = ts.groupby("Country", observed=True)["Value"].sum()
+    keep = set(totals.nlargest(top_n).index) | set(pinned)
+
+    country = np.where(ts["Country"].isin(keep), ts["Country"].astype(str), "Other")
+
+    return (
+        ts.assign(Country=country)
+        .groupby(["Year", "Country"], observed=True, as_index=False)["Value"]
+        .sum()
+    )
+
 
 # ---------- SIDEBAR ----------
 st.sidebar.header("Filters")
@@ -58,10 +135,7 @@ metric = st.sidebar.selectbox(
     ]
 )
 
-countries = sorted(
-    df.loc[~df["Importer"].str.lower().isin(TURKEY_NAMES), "Importer"]
-    .unique()
-)
+countries = get_countries()
 
 focus_country = st.sidebar.selectbox(
     "Focus Country",
@@ -75,33 +149,16 @@ compare_poland = st.sidebar.toggle(
     disabled=(focus_country == "Poland")
 )
 
-# ---------- SELECT MEASURE ----------
-TURKEY_NAMES = ["türkiye", "turkey"]
-
-is_tr_importer = df["Importer"].str.lower().isin(TURKEY_NAMES)
-is_tr_exporter = df["Exporter"].str.lower().isin(TURKEY_NAMES)
-
-if metric == "Exports to Turkey from EU":
-    data = df[is_tr_importer & (~is_tr_exporter)].copy()
-    data["Country"] = data["Exporter"]
-
-elif metric == "Exports to EU from Turkey":
-    data = df[is_tr_exporter & (~is_tr_importer)].copy()
-    data["Country"] = data["Importer"]
-
-else:  # Total Trade Volume
-    eu_to_tr = df[is_tr_importer & (~is_tr_exporter)].copy()
-    eu_to_tr["Country"] = eu_to_tr["Exporter"]
-
-    tr_to_eu = df[is_tr_exporter & (~is_tr_importer)].copy()
-    tr_to_eu["Country"] = tr_to_eu["Importer"]
-
-    combined = pd.concat([eu_to_tr, tr_to_eu], ignore_index=True)
-
-    data = (
-        combined.groupby(["Year", "Country"], as_index=False)["Value"]
-        .sum()
+# a slider needs two distinct bounds; with a single country there is nothing to cap
+if len(countries) > 1:
+    top_n = st.sidebar.slider(
+        "Countries in Trend Chart",
+        min_value=1,
+        max_value=len(countries),
+        value=min(10, len(countries))
     )
+else:
+    top_n = len(countries)
 
 # ---------- TITLES ----------
 if metric == "Total Trade Volume":
@@ -117,21 +174,21 @@ else:
 st.subheader(main_title)
 
 # ---------- TIME SERIES ----------
-ts = (
-    data.groupby(["Year", "Country"], as_index=False)["Value"]
-    .sum()
-)
+ts = get_time_series(metric)
 
 if ts.empty:
     st.warning("No data available for this selection.")
     st.stop()
 
+line_ts = get_line_series(metric, top_n, ("Poland", focus_country))
+
 fig = px.line(
-    ts,
+    line_ts,
     x="Year",
     y="Value",
     color="Country",
-    labels={"Value": "Trade Value (USD)", "Year": "Year"}
+    labels={"Value": "Trade Value (USD)", "Year": "Year"},
+    render_mode="webgl"
 )
 
 fig.update_layout(
@@ -143,48 +200,42 @@ fig.update_layout(
     )
 )
 
-for trace in fig.data:
-    if trace.name == "Poland":
-        trace.update(line=dict(width=5))
-    else:
-        trace.update(line=dict(width=1, dash="dot"))
+# style all traces in two passes: dotted thin lines, then a bold Poland line
+fig.update_traces(line=dict(width=1, dash="dot"), selector=lambda t: t.name != "Poland")
+fig.update_traces(line=dict(width=5), selector=dict(name="Poland"))
 
 fig.update_layout(
     xaxis=dict(tickmode="array", tickvals=ALL_YEARS, showgrid=True),
     yaxis_title="Trade Value (USD)",
-    legend_title_text="EU Country"
+    legend_title_text="EU Country",
+    # zoom/legend state survives reruns until the measure changes
+    uirevision=metric
 )
 
 st.plotly_chart(
     fig,
     use_container_width=True,
-    config=EXPORT_CONFIG
+    config=EXPORT_CONFIG,
+    key="eu_trend"
 )
 
 # ---------- CAGR ----------
 st.subheader(cagr_title)
 
-cagr_list = []
-
-for c in ts["Country"].unique():
-    sub = ts[ts["Country"] == c].sort_values("Year")
-
-    nonzero = sub[sub["Value"] > 0]
-    if len(nonzero) < 2:
-        continue
-
-    start_row = nonzero.iloc[0]
-    end_row = nonzero.iloc[-1]
-
-    start = start_row["Value"]
-    end = end_row["Value"]
-    years = end_row["Year"] - start_row["Year"]
-
-    if years > 0:
-        cagr = ((end / start) ** (1 / years) - 1) * 100
-        cagr_list.append({"Country": c, "CAGR": cagr})
+# first and last non-zero year per country, all countries at once
+nonzero = ts[ts["Value"] > 0].sort_values(["Country", "Year"])
+ends = nonzero.groupby("Country", observed=True).agg(
+    start=("Value", "first"),
+    end=("Value", "last"),
+    start_year=("Year", "first"),
+    end_year=("Year", "last")
+)
+ends = ends[ends["end_year"] > ends["start_year"]]
 
-cagr_df = pd.DataFrame(cagr_list)
+cagr_df = pd.DataFrame({
+    "Country": ends.index,
+    "CAGR": (np.power(ends["end"] / ends["start"], 1 / (ends["end_year"] - ends["start_year"])) - 1).to_numpy() * 100
+})
 
 if cagr_df.empty:
     st.warning("Not enough data to calculate CAGR.")
@@ -210,7 +261,8 @@ else:
     st.plotly_chart(
     fig_cagr,
     use_container_width=True,
-    config=EXPORT_CONFIG
+    config=EXPORT_CONFIG,
+    key="eu_cagr"
 )
 
 # ================= GROWTH vs SIZE MATRIX =================
@@ -220,9 +272,7 @@ latest_year = 2024
 
 # ---- SIZE: latest trade volume ----
 size_df = (
-    ts[ts["Year"] == latest_year]
-    .groupby("Country", as_index=False)["Value"]
-    .sum()
+    ts.loc[ts["Year"] == latest_year, ["Country", "Value"]]
     .rename(columns={"Value": "Size"})
 )
 
@@ -248,11 +298,11 @@ else:
     )
 
     # Highlight Poland
-    for trace in fig_matrix.data:
-        if trace.name == "Poland":
-            trace.update(marker=dict(size=22, line=dict(width=3, color="black")))
-        else:
-            trace.update(marker=dict(opacity=0.6))
+    fig_matrix.update_traces(marker=dict(opacity=0.6), selector=lambda t: t.name != "Poland")
+    fig_matrix.update_traces(
+        marker=dict(size=22, line=dict(width=3, color="black")),
+        selector=dict(name="Poland")
+    )
 
     fig_matrix.update_layout(
         title=dict(
@@ -271,18 +321,16 @@ else:
     st.plotly_chart(
         fig_matrix,
         use_container_width=True,
-        config=EXPORT_CONFIG
+        config=EXPORT_CONFIG,
+        key="eu_matrix"
     )
 
 
 # ---------- FOCUS COUNTRY ----------
 st.subheader(f"{focus_country} – Trade Over Time")
 
-focus_ts = (
-    data[data["Country"] == focus_country]
-    .groupby("Year", as_index=False)["Value"]
-    .sum()
-)
+# ts is already summed per (Year, Country): slice it instead of regrouping
+focus_ts = ts.loc[ts["Country"] == focus_country, ["Year", "Value"]]
 
 fig2 = px.line(
     focus_ts,
@@ -301,11 +349,7 @@ fig2.update_layout(
 )
 
 if compare_poland and focus_country != "Poland":
-    poland_ts = (
-        data[data["Country"] == "Poland"]
-        .groupby("Year", as_index=False)["Value"]
-        .sum()
-    )
+    poland_ts = ts.loc[ts["Country"] == "Poland", ["Year", "Value"]]
 
     fig2.add_scatter(
         x=poland_ts["Year"],
@@ -324,7 +368,8 @@ fig2.update_layout(
 st.plotly_chart(
     fig2,
     use_container_width=True,
-    config=EXPORT_CONFIG
+    config=EXPORT_CONFIG,
+    key="eu_focus"
 )
 
 # ---------- FOOTER ----------
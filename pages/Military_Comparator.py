@@ -1,9 +1,11 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os
+import plotly.graph_objects as go
 import itertools
 
+from convert_data import MILITARY_PARQUET, convert_military_trade, ensure_parquet
+
 EXPORT_CONFIG = {
     "displaylogo": False,
     "modeBarButtonsToAdd": ["toImage"],
@@ -22,20 +24,52 @@ st.title("Turkey → EU Military Trade Comparator (HS Codes, 2013–2024)")
 # ---------- LOAD ----------
 @st.cache_data
 def load_military_data():
-    base = os.path.dirname(__file__)
-    path = os.path.join(base, "..", "data", "EURMTR_Final.xlsx")
-
-    df = pd.read_excel(path)
-    df["refYear"] = df["refYear"].astype(int)
-    df["cmdCode"] = df["cmdCode"].astype(str).str.strip()
-    df["Importer"] = df["Importer"].astype(str)
-    df["primaryValue"] = pd.to_numeric(df["primaryValue"], errors="coerce").fillna(0)
+    # converted from EURMTR_Final.xlsx by convert_data.py
+    df = pd.read_parquet(ensure_parquet(MILITARY_PARQUET, convert_military_trade), engine="pyarrow")
+
+    for col in ["Importer", "cmdCode"]:
+        df[col] = df[col].astype("category")
+
+    df["refYear"] = df["refYear"].astype("int16")
+
     return df
 
-df = load_military_data()
+
+@st.cache_data
+def get_hs_codes():
+    df = load_military_data()
+    # categories are already sorted and unique
+    return df["cmdCode"].cat.categories.tolist()
+
+
+@st.cache_data
+def build_aggs(hs_selected):
+    df = load_military_data()
+    # selection flag per category, indexed by each row's category code
+    selected = df["cmdCode"].cat.categories.isin(hs_selected)
+    sub = df[selected[df["cmdCode"].cat.codes.to_numpy()]]
+
+    # small aggregate tables the views index into instead of regrouping raw rows
+    by_year_importer = (
+        sub.groupby(["refYear", "Importer"], observed=True, as_index=False)["primaryValue"]
+        .sum()
+    )
+
+    return {
+        "by_year_importer": by_year_importer,
+        "by_importer_year_code": (
+            sub.groupby(["Importer", "refYear", "cmdCode"], observed=True, as_index=False)["primaryValue"]
+            .sum()
+        ),
+        "countries": (
+            by_year_importer["Importer"].cat.remove_unused_categories().cat.categories.tolist()
+        )
+    }
+
+
 # ---------- DYNAMIC COLOR MAP FOR ALL HS CODES ----------
 base_palette = px.colors.qualitative.Set2
-unique_codes = sorted(df["cmdCode"].unique())
+unique_codes = get_hs_codes()
 
 HS_COLORS = {
     code: base_palette[i % len(base_palette)]
@@ -54,6 +88,43 @@ hs_map = {
     "8906": "Warships & Naval Vessels"
 }
 
+# legend markup per code, (active, inactive), built once instead of on every rerun
+HS_LEGEND = {
+    code: (
+        f"<span style='color:{HS_COLORS.get(code, '#FFFFFF')}; font-weight:600'>{code}</span> – {desc}",
+        f"<span style='color:#666666'>{code}</span> – {desc}"
+    )
+    for code, desc in hs_map.items()
+}
+
+
+def make_structure_pie(pie_df, title_text):
+    # a single go.Pie with prebuilt slice colors; no plotly-express frame machinery
+    codes = pie_df["cmdCode"].astype(str).tolist()
+
+    fig = go.Figure(go.Pie(
+        labels=codes,
+        values=pie_df["primaryValue"].to_numpy(),
+        hole=0.4,
+        marker_colors=[HS_COLORS.get(c) for c in codes],
+        hovertemplate="cmdCode=%{label}<br>primaryValue=%{value}<extra></extra>",
+        textfont=dict(size=18),          # percentages inside pie
+        hoverlabel=dict(font_size=16)    # hover text
+    ))
+
+    fig.update_layout(
+        title=dict(
+            text=title_text,
+            x=0.5,
+            xanchor="center",
+            font=dict(size=16)
+        ),
+        legend=dict(font=dict(size=16))  # legend text (if shown)
+    )
+
+    return fig
+
+
 # ---------- SIDEBAR ----------
 st.sidebar.header("View")
 
@@ -64,14 +135,16 @@ view_mode = st.sidebar.radio(
 
 hs_selected = st.sidebar.multiselect(
     "Select Military HS Codes",
-    options=sorted(df["cmdCode"].unique()),
-    default=sorted(df["cmdCode"].unique()),
+    options=unique_codes,
+    default=unique_codes,
     format_func=lambda x: f"{x} – {hs_map.get(x, 'Other military equipment')}"
 )
 
-df = df[df["cmdCode"].isin(hs_selected)]
+aggs = build_aggs(tuple(sorted(hs_selected)))
+by_year_importer = aggs["by_year_importer"]
+by_importer_year_code = aggs["by_importer_year_code"]
 
-if df.empty:
+if by_year_importer.empty:
     st.warning("No data for selected HS4 codes.")
     st.stop()
 
@@ -80,17 +153,15 @@ if view_mode == "Home (EU Comparison)":
 
     st.subheader("EU Comparison – Total Military Imports from Turkey")
 
-    home = (
-        df.groupby(["refYear", "Importer"], as_index=False)["primaryValue"]
-        .sum()
-    )
+    home = by_year_importer
 
     fig = px.line(
         home,
         x="refYear",
         y="primaryValue",
         color="Importer",
-        labels={"primaryValue": "Trade Value (USD)", "refYear": "Year"}
+        labels={"primaryValue": "Trade Value (USD)", "refYear": "Year"},
+        render_mode="webgl"
     )
     fig.update_layout(
         title=dict(
@@ -101,11 +172,8 @@ if view_mode == "Home (EU Comparison)":
         )
     )
 
-    for trace in fig.data:
-        if trace.name == "Poland":
-            trace.update(line=dict(width=5))
-        else:
-            trace.update(line=dict(width=1, dash="dot"))
+    fig.update_traces(line=dict(width=1, dash="dot"), selector=lambda t: t.name != "Poland")
+    fig.update_traces(line=dict(width=5), selector=dict(name="Poland"))
 
     fig.update_layout(
         legend_title_text="EU Country",
@@ -135,9 +203,7 @@ if view_mode == "Home (EU Comparison)":
     st.subheader(f"EU Ranking by Military Imports from Turkey ({rank_year})")
 
     ranking = (
-        df[df["refYear"] == rank_year]
-        .groupby("Importer", as_index=False)["primaryValue"]
-        .sum()
+        home.loc[home["refYear"] == rank_year, ["Importer", "primaryValue"]]
         .sort_values("primaryValue", ascending=False)
     )
 
@@ -164,7 +230,7 @@ if view_mode == "Home (EU Comparison)":
 else:
     st.sidebar.header("Country View")
 
-    countries = sorted(df["Importer"].unique())
+    countries = aggs["countries"]
     focus_country = st.sidebar.selectbox(
         "Focus Country",
         countries,
@@ -180,11 +246,9 @@ else:
     st.subheader(f"{focus_country} – Total Military Imports from Turkey")
 
     # -------- TIME SERIES --------
-    country_sum = (
-        df[df["Importer"] == focus_country]
-        .groupby("refYear", as_index=False)["primaryValue"]
-        .sum()
-    )
+    country_sum = by_year_importer.loc[
+        by_year_importer["Importer"] == focus_country, ["refYear", "primaryValue"]
+    ]
 
     fig = px.line(
         country_sum,
@@ -203,11 +267,9 @@ else:
     )
 
     if compare_poland and focus_country != "Poland":
-        poland = (
-            df[df["Importer"] == "Poland"]
-            .groupby("refYear", as_index=False)["primaryValue"]
-            .sum()
-        )
+        poland = by_year_importer.loc[
+            by_year_importer["Importer"] == "Poland", ["refYear", "primaryValue"]
+        ]
 
         fig.add_scatter(
             x=poland["refYear"],
@@ -245,41 +307,18 @@ else:
 
     col1, col2 = st.columns(2)
 
-    pie_focus = (
-        df[(df["Importer"] == focus_country) & (df["refYear"] == pie_year)]
-        .groupby("cmdCode", as_index=False)["primaryValue"]
-        .sum()
-    )
+    pie_focus = by_importer_year_code.loc[
+        (by_importer_year_code["Importer"] == focus_country)
+        & (by_importer_year_code["refYear"] == pie_year),
+        ["cmdCode", "primaryValue"]
+    ]
 
     with col1:
         st.markdown(f"### {focus_country} ({pie_year})")
         if pie_focus.empty:
             st.info(f"No data for {focus_country} in {pie_year}.")
         else:
-            fig_pie = px.pie(
-                pie_focus,
-                names="cmdCode",
-                values="primaryValue",
-                hole=0.4,
-                color="cmdCode",
-                color_discrete_map=HS_COLORS
-            )
-            fig_pie.update_layout(
-                title=dict(
-                    text=f"{focus_country} – Structure ({pie_year})",
-                    x=0.5,
-                    xanchor="center",
-                    font=dict(size=16)
-                )
-            )
-            fig_pie.update_traces(
-                textfont=dict(size=18),          # percentages inside pie
-                hoverlabel=dict(font_size=16)    # hover text
-            )
-
-            fig_pie.update_layout(
-                legend=dict(font=dict(size=16))  # legend text (if shown)
-            )
+            fig_pie = make_structure_pie(pie_focus, f"{focus_country} – Structure ({pie_year})")
             st.plotly_chart(
                 fig_pie,
                 use_container_width=True,
@@ -287,41 +326,18 @@ else:
             )
 
     if compare_poland and focus_country != "Poland":
-        pie_poland = (
-            df[(df["Importer"] == "Poland") & (df["refYear"] == pie_year)]
-            .groupby("cmdCode", as_index=False)["primaryValue"]
-            .sum()
-        )
+        pie_poland = by_importer_year_code.loc[
+            (by_importer_year_code["Importer"] == "Poland")
+            & (by_importer_year_code["refYear"] == pie_year),
+            ["cmdCode", "primaryValue"]
+        ]
 
         with col2:
             st.markdown(f"### Poland ({pie_year})")
             if pie_poland.empty:
                 st.info(f"No data for Poland in {pie_year}.")
             else:
-                fig_pie_pl = px.pie(
-                    pie_poland,
-                    names="cmdCode",
-                    values="primaryValue",
-                    hole=0.4,
-                    color="cmdCode",
-                    color_discrete_map=HS_COLORS
-                )
-                fig_pie_pl.update_layout(
-                    title=dict(
-                        text=f"Poland – Structure ({pie_year})",
-                        x=0.5,
-                        xanchor="center",
-                        font=dict(size=16)
-                    )
-                )
-                fig_pie_pl.update_traces(
-                    textfont=dict(size=18),
-                    hoverlabel=dict(font_size=16)
-                )
-
-                fig_pie_pl.update_layout(
-                    legend=dict(font=dict(size=16))
-                )
+                fig_pie_pl = make_structure_pie(pie_poland, f"Poland – Structure ({pie_year})")
                 st.plotly_chart(
                     fig_pie_pl,
                     use_container_width=True,
@@ -335,18 +351,13 @@ else:
     if compare_poland and focus_country != "Poland" and not pie_poland.empty:
         active_codes = active_codes.union(set(pie_poland["cmdCode"]))
 
-    for code, desc in hs_map.items():
-        if code in active_codes:
-            color = HS_COLORS.get(code, "#FFFFFF")
-            st.markdown(
-                f"<span style='color:{color}; font-weight:600'>{code}</span> – {desc}",
-                unsafe_allow_html=True
-            )
-        else:
-            st.markdown(
-                f"<span style='color:#666666'>{code}</span> – {desc}",
-                unsafe_allow_html=True
-            )
+    legend_lines = [
+        active if code in active_codes else inactive
+        for code, (active, inactive) in HS_LEGEND.items()
+    ]
+
+    # one markdown element (one paragraph per code) instead of one element per code
+    st.markdown("\n\n".join(legend_lines), unsafe_allow_html=True)
 
 # ---------- FOOTER ----------
 st.sidebar.markdown("---")